@@ -1,10 +1,13 @@
 # dashboards/app.py
 import pandas as pd
 import numpy as np
+from functools import lru_cache
 from pathlib import Path
 import streamlit as st
 import plotly.express as px
-from PIL import Image
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 # ---------- SE Water Theming ----------
 SE_TEAL = "#00A9B7"
@@ -16,8 +19,6 @@ SE_LightBlue = "#22E5F7"
 st.set_page_config(page_title="Water Consumption Analytics | SE Water", layout="wide", page_icon="💧")
 
 # ---- Colour helpers (distinct + colour-blind friendly) ----
-import plotly.express as px
-
 OKABE_ITO = [
     "#86D36F", "#E69F00", "#56B4E9", "#009E73",
     "#F0E442", "#0072B2", "#D55E00", "#CC79A7", "#999999"
@@ -25,19 +26,34 @@ OKABE_ITO = [
 EXTRA = px.colors.qualitative.Set3 + px.colors.qualitative.D3 + px.colors.qualitative.Bold
 MASTER_PALETTE = OKABE_ITO + EXTRA  # big, high-contrast palette
 
-def build_color_map(values, palette=MASTER_PALETTE):
-    """Return a stable dict {value: color} covering all category values."""
+@lru_cache(maxsize=32)
+def _color_map(values, palette):
     uniq = list(dict.fromkeys(values))                 # preserve order, de-dupe
     need = len(uniq)
     base = (palette * ((need // len(palette)) + 1))[:need]
     return {k: c for k, c in zip(uniq, base)}
 
+def build_color_map(values, palette=MASTER_PALETTE):
+    """Return a stable dict {value: color} covering all category values."""
+    return dict(_color_map(tuple(values), tuple(palette)))  # copy: the cached dict is shared
+
 def category_args(df, col, order=None):
     """Convenience: consistent order + colours for a column."""
     order = order or list(dict.fromkeys(df[col].dropna()))
     cmap = build_color_map(order)
     return dict(category_orders={col: order}, color_discrete_map=cmap)
 
+def top_k_other(df, col, k, other="Other"):
+    """Keep the k largest values of `col` by consumption and fold the rest into one `other` bucket.
+    Plotly draws one trace per colour, so this caps the trace count on big category sets."""
+    if df[col].nunique() <= k:
+        return df
+    top = df.groupby(col, observed=True)["consumption"].sum().nlargest(k).index
+    labels = df[col].astype(str).where(df[col].isin(top), other)
+    out = df.assign(**{col: labels}).groupby([col, "year"], sort=False)["consumption"].sum().reset_index()
+    # Keep the top labels in their original order and the catch-all bucket last
+    return out.sort_values(col, key=lambda s: s.eq(other), kind="stable", ignore_index=True)
+
 
 import plotly.io as pio
 
@@ -130,7 +146,6 @@ st.markdown(
 
 
 # ---------- Header with logo ----------
-from PIL import Image
 LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "se_water_logo.png"
 
 # Sidebar logo (centered)
@@ -156,22 +171,59 @@ st.caption(
 DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "processed"
 PARQUET = DATA_DIR / "water_long.parquet"
 CSV_FALLBACK = DATA_DIR / "water_long.csv"
+ROLLUP = DATA_DIR / "water_rollup.parquet"
+ROLLUP_KEYS = ["year", "business_type", "resource zone", "occupancy_status"]
+
+def vacant_rows(status):
+    """Boolean mask for vacant rows; the text match runs once per category, not per row."""
+    vacant_mask = status.cat.categories.str.contains("vacant", case=False, na=False)
+    return status.cat.codes.isin(np.where(vacant_mask)[0]).to_numpy()
+
+def clean_labels(s, missing):
+    """Trim with Arrow's vectorised string kernel and dictionary-encode straight to a categorical."""
+    arr = pc.utf8_trim_whitespace(pc.cast(pa.array(s, from_pandas=True), pa.string()))
+    arr = pc.fill_null(arr, missing)
+    cat = arr.dictionary_encode().to_pandas().values
+    return cat.reorder_categories(sorted(cat.categories))  # sorted, as astype("category") gives
+
+def clean_frame(df, missing="None"):
+    # `missing` is the label astype(str) used to give empty labels: parquet reads them
+    # back as None ("None"), read_csv as NaN ("nan")
+    for c in ["business_type", "resource zone", "occupancy_status"]:
+        if c in df.columns: df[c] = clean_labels(df[c], missing)
+    if "occupancy_status" in df.columns: df["is_vacant"] = vacant_rows(df["occupancy_status"])
+    if not df["year"].is_monotonic_increasing:  # prepare_data.py already writes year-sorted files
+        df = df.sort_values("year", kind="stable", ignore_index=True)
+    return df.dropna(subset=["consumption"])
 
 @st.cache_data
-def load_data():
+def load_data(columns=None):
+    """Row-level frame, optionally projected to `columns` (those that exist)."""
     if PARQUET.exists():
-        df = pd.read_parquet(PARQUET)
+        if columns is not None:
+            names = pq.read_schema(PARQUET).names
+            columns = [c for c in columns if c in names]
+        df = pd.read_parquet(PARQUET, columns=columns)  # year/consumption already typed
     elif CSV_FALLBACK.exists():
-        df = pd.read_csv(CSV_FALLBACK)
+        df = pd.read_csv(CSV_FALLBACK, usecols=lambda c: columns is None or c in columns,
+                         dtype={"year": "int16", "consumption": "float64"})
+        return clean_frame(df, missing="nan")
     else:
         return None
-    for c in ["business_type", "resource zone", "occupancy_status"]:
-        if c in df.columns: df[c] = df[c].astype(str).str.strip()
-    df["year"] = df["year"].astype(int)
-    df["consumption"] = pd.to_numeric(df["consumption"], errors="coerce")
-    return df.dropna(subset=["consumption"])
+    return clean_frame(df)
 
-df = load_data()
+@st.cache_data
+def load_rollup():
+    """Per-(year, business, zone, occupancy) sums; every tab except the explorer works off this."""
+    if ROLLUP.exists():
+        return clean_frame(pd.read_parquet(ROLLUP))
+    df = load_data(tuple(ROLLUP_KEYS + ["consumption"]))
+    if df is None:
+        return None
+    keys = [c for c in ROLLUP_KEYS if c in df.columns] + (["is_vacant"] if "is_vacant" in df.columns else [])
+    return df.groupby(keys, observed=True, dropna=False)["consumption"].agg(consumption="sum", rows="size").reset_index()
+
+df = load_rollup()
 if df is None or df.empty:
     st.warning("No processed data found. Run `python src/prepare_data.py` first.")
     st.stop()
@@ -206,10 +258,60 @@ if st.sidebar.button("Reset filters"):
     st.session_state.clear()
     st.experimental_rerun()
 
+# ---------- Cached aggregates (shared across tabs) ----------
+def category_codes(s, values):
+    """Integer codes of the selected labels in a categorical column (unknown labels dropped)."""
+    codes = s.cat.categories.get_indexer(list(values))
+    return codes[codes >= 0].astype(np.int32)
+
+def filter_frame(df, years, zones, biz):
+    # Frames from clean_frame() are year-sorted, so each selected year is one contiguous slice
+    y = df["year"].to_numpy()
+    years = np.asarray(years, dtype=y.dtype)
+    mask = np.zeros(len(y), dtype=bool)
+    for lo, hi in zip(np.searchsorted(y, years, "left"), np.searchsorted(y, years, "right")):
+        mask[lo:hi] = True
+    if "resource zone" in df.columns:
+        mask &= np.isin(df["resource zone"].cat.codes.to_numpy(), category_codes(df["resource zone"], zones))
+    if biz:
+        mask &= np.isin(df["business_type"].cat.codes.to_numpy(), category_codes(df["business_type"], biz))
+    return df.iloc[np.flatnonzero(mask)]
+
+# Leading underscore tells Streamlit not to hash the frame; it already comes
+# from the cached load_rollup(), so the filter tuples are enough as a key.
+@st.cache_data
+def agg_by_business(_df, years, zones, biz):
+    f = filter_frame(_df, years, zones, biz)
+    return f.groupby(["business_type", "year"], observed=True, dropna=False)["consumption"].sum().reset_index()
+
+@st.cache_data
+def agg_by_zone(_df, years, zones, biz):
+    f = filter_frame(_df, years, zones, biz)
+    return f.groupby(["resource zone", "year"], observed=True)["consumption"].sum().reset_index()
+
+@st.cache_data
+def agg_by_occupancy(_df, years, zones, biz):
+    f = filter_frame(_df, years, zones, biz)
+    return f.groupby(["occupancy_status", "is_vacant", "year"], observed=True)["consumption"].sum().reset_index()
+
+# ---------- Cached figures ----------
+# st.cache_resource hands back the same Figure object, so every layout tweak
+# goes through `layout` here rather than being applied to the returned figure.
+def frame_key(data):
+    """Content hash of a small aggregated frame, used as the explicit figure-cache key."""
+    return hash((tuple(data.columns), tuple(map(str, data.dtypes)),
+                 pd.util.hash_pandas_object(data).values.tobytes()))
+
+@st.cache_resource(max_entries=64)
+def cached_figure(data_key, kind, _data, layout=None, **kwargs):
+    fig = getattr(px, kind)(_data, **kwargs)
+    if layout:
+        fig.update_layout(**layout)
+    return fig
+
 # ---------- Apply filters + friendly guard ----------
-dff = df[df["year"].isin(year_sel)]
-if zones_all: dff = dff[dff["resource zone"].isin(zone_sel)]
-if biz_all and biz_sel: dff = dff[dff["business_type"].isin(biz_sel)]
+filter_key = (tuple(year_sel), tuple(zone_sel), tuple(biz_sel))
+dff = filter_frame(df, *filter_key)
 
 if len(year_sel) == 0 or dff.empty:
     st.warning("No data selected. Adjust filters on the left.")
@@ -219,17 +321,18 @@ if len(year_sel) == 0 or dff.empty:
 def kpi(col, label, value, help_text=None):
     col.metric(label, f"{value:,.0f}", help=help_text)
 
-total = dff["consumption"].sum()
-yr2022 = dff.loc[dff["year"]==2022, "consumption"].sum() if 2022 in dff["year"].unique() else 0
-vacant = 0
-if "occupancy_status" in dff.columns:
-    vacant = dff.loc[dff["occupancy_status"].str.contains("vacant", case=False, na=False),"consumption"].sum()
+w = dff["consumption"].to_numpy()
+y = dff["year"].to_numpy()
+totals = np.bincount(y - y.min(), weights=w)  # one pass: per-year sums
+total = totals.sum()
+yr2022 = totals[2022 - y.min()] if y.min() <= 2022 < y.min() + len(totals) else 0
+vacant = w[dff["is_vacant"].to_numpy()].sum() if "is_vacant" in dff.columns else 0
 
 c1, c2, c3, c4 = st.columns(4)
 kpi(c1, "Total (filters)", total)
 kpi(c2, "Total in 2022", yr2022, "Hot/dry benchmark")
 if "occupancy_status" in dff.columns: kpi(c3, "Vacant consumption", vacant)
-kpi(c4, "Rows in view", len(dff))
+kpi(c4, "Rows in view", dff["rows"].sum())
 
 st.divider()
 
@@ -242,12 +345,13 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs([
 with tab1:
     st.subheader("Year-on-Year Water Use by Business Type")
     if "business_type" in df.columns:
-        byb = df.groupby(["business_type", "year"], dropna=False)["consumption"].sum().reset_index()
+        byb = agg_by_business(df, *filter_key)
 
-        args = category_args(byb, "business_type")  
+        byb_plot = top_k_other(byb, "business_type", 15)
+        args = category_args(byb_plot, "business_type")
 
-        fig = px.bar(
-            byb, x="year", y="consumption", color="business_type",
+        fig = cached_figure(
+            frame_key(byb_plot), "bar", byb_plot, x="year", y="consumption", color="business_type",
             title="Consumption by Business Type (Yearly)", barmode="stack",
             **args  # 🔹 pass in consistent colour + order
         )
@@ -256,12 +360,13 @@ with tab1:
         latest = max(year_sel) if len(year_sel) else int(df["year"].max())
         top_latest = byb[byb["year"] == latest].sort_values("consumption", ascending=False)
 
-        fig2 = px.bar(
-            top_latest.head(15), x="business_type", y="consumption",
+        top_latest = top_latest.head(15)
+        fig2 = cached_figure(
+            frame_key(top_latest), "bar", top_latest, x="business_type", y="consumption",
             title=f"Top Business Types in {latest}", text_auto=True,
-            **args  # 🔹 use same colours here too
+            layout=dict(xaxis_title=None),
+            **category_args(byb, "business_type")  # 🔹 full type list, same colours as the baseline chart
         )
-        fig2.update_layout(xaxis_title=None)
         st.plotly_chart(fig2, use_container_width=True)
     else:
         st.info("No `business_type` column detected.")
@@ -271,20 +376,19 @@ with tab1:
 with tab2:
     st.subheader("Vacant Property Consumption")
     if "occupancy_status" in df.columns:
-        occ = df.groupby(["occupancy_status", "year"])["consumption"].sum().reset_index()
-        vac = occ[occ["occupancy_status"].str.contains("vacant", case=False, na=False)]
+        occ = agg_by_occupancy(df, *filter_key)
+        vac = occ[occ["is_vacant"]].drop(columns="is_vacant")
         if not vac.empty:
             vac["year"] = vac["year"].astype(str)
-            fig = px.line(
-                vac, x="year", y="consumption", markers=True,
+            fig = cached_figure(
+                frame_key(vac), "line", vac, x="year", y="consumption", markers=True,
                 title="Vacant Consumption by Year",
                 color_discrete_sequence=MASTER_PALETTE
             )
             st.plotly_chart(fig, use_container_width=True)
 
-            total_by_year = df.groupby("year")["consumption"].sum().rename("total").reset_index()
-            total_by_year["year"] = total_by_year["year"].astype(str)
-            share = vac.merge(total_by_year, on="year")
+            total_by_year = occ.groupby("year")["consumption"].sum()
+            share = vac.assign(total=vac["year"].astype(int).map(total_by_year))
             share["vacant_share_%"] = 100 * share["consumption"] / share["total"]
             st.dataframe(share.sort_values("year"))
         else:
@@ -298,17 +402,29 @@ with tab2:
 # ---- 2022 Anomalies ----
 with tab3:
     st.subheader("2022 Anomalies vs Baseline")
-    if "business_type" in df.columns and 2022 in df["year"].unique():
-        base = df.groupby(["business_type", "year"])["consumption"].sum().reset_index()
-        pvt = base.pivot(index="business_type", columns="year", values="consumption").fillna(0)
-        others = [y for y in pvt.columns if y != 2022]
-        if others:
-            pvt["baseline"] = pvt[others].mean(axis=1).replace(0, np.nan)
-            pvt["pct_change_2022_vs_baseline"] = (pvt[2022] - pvt["baseline"]) / pvt["baseline"] * 100
-            out = pvt.sort_values("pct_change_2022_vs_baseline", ascending=False).reset_index()
-
-            figp = px.bar(
-                out.head(10),
+    if "business_type" in df.columns and 2022 in year_sel:
+        base = agg_by_business(df, *filter_key)
+        is22 = base["year"].eq(2022)
+        n_other = base.loc[~is22, "year"].nunique()
+        if n_other:
+            # Baseline = mean over the other years, missing years counting as zero.
+            # Both sums come from bincount over the business category codes.
+            codes = base["business_type"].cat.codes.to_numpy()
+            cats = base["business_type"].cat.categories
+            w = base["consumption"].to_numpy()
+            in22 = is22.to_numpy()
+            s22 = np.bincount(codes, weights=np.where(in22, w, 0), minlength=len(cats))
+            s_other = np.bincount(codes, weights=np.where(in22, 0, w), minlength=len(cats))
+            seen = np.bincount(codes, minlength=len(cats)) > 0
+            baseline = np.where(s_other == 0, np.nan, s_other / n_other)
+            out = pd.DataFrame({
+                "business_type": cats[seen],
+                "pct_change_2022_vs_baseline": ((s22 - baseline) / baseline * 100)[seen],
+            }).sort_values("pct_change_2022_vs_baseline", ascending=False)
+
+            out = out.head(10)
+            figp = cached_figure(
+                frame_key(out), "bar", out,
                 x="business_type",
                 y="pct_change_2022_vs_baseline",
                 title="Largest Increases in 2022 (vs baseline)",
@@ -329,11 +445,12 @@ with tab3:
 with tab4:
     st.subheader("Usage by Resource Zone")
     if "resource zone" in df.columns:
-        byz = df.groupby(["resource zone", "year"])["consumption"].sum().reset_index()
+        byz = agg_by_zone(df, *filter_key)
         byz["year"] = byz["year"].astype(str)
 
-        fig = px.area(
-            byz, x="year", y="consumption", color="resource zone",
+        byz_plot = top_k_other(byz, "resource zone", 30)
+        fig = cached_figure(
+            frame_key(byz_plot), "area", byz_plot, x="year", y="consumption", color="resource zone",
             title="Yearly Consumption by Resource Zone",
             color_discrete_sequence=MASTER_PALETTE
         )
@@ -342,13 +459,13 @@ with tab4:
         latest = max(year_sel) if len(year_sel) else int(df["year"].max())
         latest_rank = byz[byz["year"] == str(latest)].sort_values("consumption", ascending=False)
 
-        fig2 = px.bar(
-            latest_rank, x="resource zone", y="consumption",
+        fig2 = cached_figure(
+            frame_key(latest_rank), "bar", latest_rank, x="resource zone", y="consumption",
             title=f"Resource Zones Ranked ({latest})",
             text_auto=True,
-            color_discrete_sequence=MASTER_PALETTE
+            color_discrete_sequence=MASTER_PALETTE,
+            layout=dict(xaxis_title=None),
         )
-        fig2.update_layout(xaxis_title=None)
         st.plotly_chart(fig2, use_container_width=True, key="rz_rank")
     else:
         st.info("No `resource zone` column detected.")
@@ -358,4 +475,15 @@ with tab4:
 # ---- Data Explorer ----
 with tab5:
     st.subheader("Data Explorer")
-    st.dataframe(dff.sort_values(["year"], ascending=True))
+    # Tab bodies run on every rerun, so the row-level file is only read on request;
+    # everything else works off the rollup
+    raw = load_data() if st.toggle("Load row-level data", key="show_rows") else None
+    if raw is not None:
+        view = filter_frame(raw, *filter_key)  # already year-sorted by clean_frame()
+        if len(view) > 1000:
+            st.caption(f"Showing the first 1,000 of {len(view):,} rows.")
+        st.dataframe(view.head(1000).drop(columns="is_vacant", errors="ignore"))
+    elif st.session_state.get("show_rows"):
+        st.info("Row-level data not found; only the rollup is available.")
+    else:
+        st.caption("Switch on to browse individual property rows.")
@@ -1,5 +1,7 @@
 import re
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 
 RAW_PATH = Path(__file__).resolve().parents[1] / "data" / "raw" / "DRA_exercise.xlsx"
@@ -13,20 +15,30 @@ COLUMN_ALIASES = {
     "property_id": ["spid", "id", "site id"],
 }
 
+ALIAS_TO_TARGET = {a: (t, i) for t, aliases in COLUMN_ALIASES.items() for i, a in enumerate(aliases)}
+
+ROLLUP_KEYS = ["year", "business_type", "resource zone", "occupancy_status"]
+
 def normalize_columns(df):
     df.columns = [c.strip().lower() for c in df.columns]
-    rename = {}
-    for target, aliases in COLUMN_ALIASES.items():
-        for alias in aliases:
-            if alias in df.columns:
-                rename[alias] = target
-                break
-    df = df.rename(columns=rename)
-    return df
+    # One pass over the columns; the earliest alias in the list wins per target
+    found = {}
+    for c in df.columns:
+        if c in ALIAS_TO_TARGET:
+            target, rank = ALIAS_TO_TARGET[c]
+            if target not in found or rank < found[target][1]:
+                found[target] = (c, rank)
+    return df.rename(columns={c: target for target, (c, _) in found.items()})
 
 def detect_year_columns(df):
     return [c for c in df.columns if re.search(r"20\d{2}", c)]
 
+def write_parquet(df, path):
+    """Dictionary-encoded, zstd-compressed parquet with large row groups."""
+    tbl = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(tbl, path, row_group_size=250_000, use_dictionary=True,
+                   compression="zstd", compression_level=3)
+
 def main():
     df = pd.read_excel(RAW_PATH)
     df = normalize_columns(df)
@@ -35,12 +47,27 @@ def main():
 
     long_df = df.melt(id_vars=id_vars, value_vars=year_cols,
                       var_name="year_col", value_name="consumption")
-    long_df["year"] = long_df["year_col"].str.extract(r"(20\d{2})").astype(int)
+    year_map = {c: int(re.search(r"20\d{2}", c).group(0)) for c in year_cols}
+    long_df["year"] = long_df["year_col"].map(year_map).astype("int16")
     long_df["consumption"] = pd.to_numeric(long_df["consumption"], errors="coerce")
     long_df = long_df.dropna(subset=["consumption"])
+    long_df = long_df.sort_values("year", kind="stable")  # lets the dashboard slice years by searchsorted
+    long_df = long_df.drop(columns=["year_col"])
+
+    # Pre-summed rollup: the dashboard only slices and sums, so it can work off this
+    keys = [c for c in ROLLUP_KEYS if c in long_df.columns]
+    roll = long_df.groupby(keys, observed=True, dropna=False)["consumption"] \
+        .agg(consumption="sum", rows="size").reset_index()
+
+    # Store float32 only if every value round-trips exactly; otherwise (as with the
+    # current extract) consumption stays float64
+    as32 = long_df["consumption"].astype("float32")
+    if (as32.astype("float64") == long_df["consumption"]).all():
+        long_df["consumption"] = as32
 
-    long_df.to_parquet(OUT_DIR / "water_long.parquet", index=False)
+    write_parquet(long_df, OUT_DIR / "water_long.parquet")
     long_df.to_csv(OUT_DIR / "water_long.csv", index=False)
+    write_parquet(roll, OUT_DIR / "water_rollup.parquet")
     print("✅ Data prepared and saved to data/processed/")
 
 if __name__ == "__main__":
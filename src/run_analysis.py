@@ -1,28 +1,35 @@
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from pathlib import Path
 
 DATA = Path(__file__).resolve().parents[1] / "data" / "processed" / "water_long.parquet"
 OUT = Path(__file__).resolve().parents[1] / "reports"
 OUT.mkdir(parents=True, exist_ok=True)
+COLUMNS = ["year", "business_type", "resource zone", "occupancy_status", "consumption"]
 
-def pct_change_2022_vs_baseline(pvt):
-    years = [c for c in pvt.columns if isinstance(c, (int, np.integer))]
-    if 2022 not in years:
+def pct_change_2022_vs_baseline(by_business):
+    is22 = by_business["year"].eq(2022)
+    if not is22.any():
         return pd.DataFrame(columns=["business_type", "pct_change_vs_baseline"])
-    others = [y for y in years if y != 2022]
-    baseline = pvt[others].mean(axis=1).replace(0, np.nan)
-    delta = (pvt[2022] - baseline) / baseline * 100
-    return delta.to_frame("pct_change_vs_baseline").reset_index()
+    # Baseline is the mean over the other years, with missing years counted as zero
+    n_other = by_business.loc[~is22, "year"].nunique()
+    s22 = by_business.loc[is22].groupby("business_type", observed=True, dropna=False)["consumption"].sum()
+    s_other = by_business.loc[~is22].groupby("business_type", observed=True, dropna=False)["consumption"].sum()
+    idx = s22.index.union(s_other.index).sort_values(na_position="first")
+    baseline = (s_other.reindex(idx, fill_value=0) / n_other).replace(0, np.nan) if n_other else np.nan
+    delta = (s22.reindex(idx, fill_value=0) - baseline) / baseline * 100
+    return delta.rename_axis("business_type").to_frame("pct_change_vs_baseline").reset_index()
 
 def main():
-    df = pd.read_parquet(DATA)
+    names = pq.read_schema(DATA).names
+    df = pd.read_parquet(DATA, columns=[c for c in COLUMNS if c in names])
     df["consumption"] = pd.to_numeric(df["consumption"], errors="coerce")
 
     by_year = df.groupby("year")["consumption"].sum().reset_index()
-    by_business = df.groupby(["business_type", "year"], dropna=False)["consumption"].sum().reset_index()
-    by_zone = df.groupby(["resource zone", "year"], dropna=False)["consumption"].sum().reset_index()
-    by_occ = df.groupby(["occupancy_status", "year"], dropna=False)["consumption"].sum().reset_index() \
+    by_business = df.groupby(["business_type", "year"], observed=True, dropna=False)["consumption"].sum().reset_index()
+    by_zone = df.groupby(["resource zone", "year"], observed=True, dropna=False)["consumption"].sum().reset_index()
+    by_occ = df.groupby(["occupancy_status", "year"], observed=True, dropna=False)["consumption"].sum().reset_index() \
         if "occupancy_status" in df.columns else None
 
     # Save CSVs
@@ -33,8 +40,7 @@ def main():
         by_occ.to_csv(OUT / "occupancy_by_year.csv", index=False)
 
     # 2022 anomalies
-    pvt = by_business.pivot(index="business_type", columns="year", values="consumption").fillna(0)
-    anomalies = pct_change_2022_vs_baseline(pvt)
+    anomalies = pct_change_2022_vs_baseline(by_business)
     anomalies.to_csv(OUT / "anomalies_2022_vs_baseline.csv", index=False)
 
     # Write markdown summary